@@ -0,0 +1,114 @@
+#!/usr/bin/env python3.2
+# -*- coding: utf-8 -*-
+
+"""Benchmark the TrimSubs processing stages with generated data
+
+Requirements:
+- Python 3.2: <http://www.python.org/>
+- PySubs <http://pypi.python.org/pypi/pysubs>
+
+Usage:
+    Benchmark.py [trims ...]
+
+Time the reading, normalization and binary search of random unsorted,
+overlapping and duplicated Trims, for every number of Trims given
+(default 10000, 100000).  The time per Trim should grow only slowly
+with the number of Trims, as every stage is O(n log n).
+
+Time also the snapping of 100000 subtitle lines to the frame boundaries
+of a VFR timecode with 1000000 frames (--snap), best of 3 runs.
+
+
+Copyright (C) 2012  Diego Fernández Gosende <dfgosende@gmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program.  If not, see <http://www.gnu.org/licenses/gpl-3.0.html>.
+
+"""
+
+import os
+import sys
+import random
+import tempfile
+from array import array
+from timeit import default_timer as timer
+sys.dont_write_bytecode = True
+import pysubs
+from TrimSubs import read_trims, normalize_trims, cut_ranges, snap_subs
+
+def bench_trims(count):
+    """Time read_trims, normalize_trims and cut_ranges with 'count' Trims"""
+    random.seed(count)
+    trims = []
+    for i in range(count):
+        if trims and not i % 50:  # some duplicates
+            trims.append(random.choice(trims))
+        else:
+            start = random.randint(0, count * 100)
+            trims.append((start, start + random.randint(0, 150)))
+    fd, avs = tempfile.mkstemp(suffix='.avs')
+    with os.fdopen(fd, mode='w') as file:
+        file.write('++'.join('Trim({},{})'.format(*trim)
+                             for trim in trims) + '\n')
+    lines = []
+    for i in range(count):
+        start = random.randint(0, count * 100)
+        lines.append((start, start + random.randint(10, 200)))
+    try:
+        t0 = timer()
+        trims = read_trims(avs)
+        t1 = timer()
+        trims = normalize_trims(trims)
+        t2 = timer()
+        cut_ranges(trims, lines)
+        t3 = timer()
+    finally:
+        os.remove(avs)
+    print('{:>8} Trims ({:>7} merged):  read {:.3f} s,  normalize {:.3f} s,  '
+          'cut {} lines {:.3f} s  ({:.2f} us/Trim)'.format(count, len(trims),
+          t1 - t0, t2 - t1, len(lines), t3 - t2, (t3 - t0) * 1e6 / count))
+
+def bench_snap(count=100000, frames=1000000, repeat=3):
+    """Time snap_subs with 'count' lines and a timecode of 'frames'
+    
+    Report the best of 'repeat' runs, every one with new lines.
+    
+    """
+    random.seed(frames)
+    timecodes = array('d', [0])
+    for i in range(frames):
+        timecodes.append(timecodes[-1] + random.choice([41.708, 33.367]))
+    times = []
+    for i in range(count):
+        start = random.uniform(0, timecodes[-1] - 10000)
+        times.append((round(start), round(start + random.uniform(10, 5000))))
+    best = None
+    for i in range(repeat):
+        subs = pysubs.SSAFile()
+        for start, end in times:
+            line = pysubs.SSAEvent()
+            line.start = pysubs.Time(ms=start)
+            line.end = pysubs.Time(ms=end)
+            subs.events.append(line)
+        t0 = timer()
+        snap_subs(subs, None, timecodes)
+        t1 = timer()
+        if best is None or t1 - t0 < best:
+            best = t1 - t0
+    print('{:>8} lines, {} frames:  snap {:.3f} s  ({:.2f} us/line)'
+          .format(count, frames, best, best * 1e6 / count))
+
+if __name__ == '__main__':
+    for count in [int(arg) for arg in sys.argv[1:]] or [10000, 100000]:
+        bench_trims(count)
+    bench_snap()
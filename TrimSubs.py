@@ -19,6 +19,9 @@ There are three ways of specifying the line of the avs used:
    It can be combined with a parsing order.
  - Directly specifying the Trims line number, starting with 1.
 
+The Trims don't need to be sorted.  Overlapping and duplicated Trims 
+are merged, and segments reordered by the splicing keep their order.
+
 A frame rate or timecode file (v1 or v2) is required, except for MicroDVD 
 subtitles.  The FPS can be either a float value or a fraction.  If the 
 timebase is not specified, the avs directory is searched for a timecode 
@@ -28,7 +31,15 @@ instead.
 If the path of the input subtitle file is not supplied in the input 
 parameter, the avs directory is searched for a subtitle file with the 
 same name as the Avisynth script.  If not given, the path of the output 
-subtitle is derived from the input file.
+subtitle is derived from the input file.  Several output files can be 
+given by repeating --output, e.g. an ASS and a SRT.  The input file is 
+read and cut only once, and every output is saved in the format given 
+by its extension.  ASS, SSA and SRT input files can also be saved as 
+SUB (MicroDVD), using the frame rate or the trimmed timecodes.
+
+The start and end of the output lines can be snapped to the nearest 
+frame boundary of the trimmed video, to avoid lines starting or ending 
+between frames.
 
 An encoding for the input file can be specified.  It should only be 
 necesary if it's neither a Unicode encoding nor the system's locale 
@@ -38,6 +49,17 @@ encoding.  List of available encodings:
 A new trimmed timecode v2 file can be generated optionally.  If a path 
 is not given, then is derived from the input timecode or the avs script.
 
+Timecode and subtitle files can be compressed with gzip, bzip2 or xz 
+(bzip2 and xz require Python 3.3).  Compressed input files are detected 
+by their content, and output files are compressed if their path ends 
+in .gz, .bz2 or .xz.  The automatic search of timecode and subtitle files also 
+looks for compressed files.
+
+The reverse operation is also possible with --to-source: the input 
+subtitle file is timed against the trimmed video, and it's mapped back 
+to its position in the source video.  Lines that cross the boundary 
+between two Trims are split.
+
 Supported subtitle formats: ASS, SSA, SRT, SUB (MicroDVD).
 
 
@@ -74,6 +96,10 @@ with this program.  If not, see <http://www.gnu.org/licenses/gpl-3.0.html>.
 _tc_suffix = ['.tc.txt', '.timecode.txt', '.timecodes.txt', 'timecode', 
               'timecodes', '.txt']
 
+# Extensions of compressed files, added to the automatic search of timecode and 
+# subtitle files
+_compressed_ext = ['.gz', '.bz2', '.xz']
+
 # Default FPS, if --fps is not supplied and not timecode is found
 _default_fps = '24000/1001'
 
@@ -92,8 +118,22 @@ try:
 except ImportError:
     exit('PySubs not found. \nPlease install PySubs, '
          'or put this script in the extraction directory.')
+from bisect import bisect_left, bisect_right
+from os import close, remove
 from os.path import isfile, splitext  
 import re
+import gzip
+import bz2
+try:
+    import lzma
+except ImportError:
+    lzma = None
+from io import TextIOWrapper
+from shutil import copyfileobj
+from tempfile import mkstemp
+from contextlib import contextmanager
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from argparse import (ArgumentParser, RawDescriptionHelpFormatter, 
                       HelpFormatter, Action)
 
@@ -112,7 +152,8 @@ def main():
     if not isinstance(args.input, bool):
         if not args.input:
             sub_ext = ['.ass', '.ssa', '.srt', '.sub']
-            for path in (avs_no_ext + ext for ext in sub_ext):
+            for path in (avs_no_ext + ext + comp for ext in sub_ext 
+                         for comp in [''] + _compressed_ext):
                 if isfile(path):
                     args.input = path
                     break
@@ -120,10 +161,20 @@ def main():
                 exit('Not subtitle file found')
         elif not isfile(args.input):
             exit('Invalid subtitle file path')
+    if args.input:
+        input_no_comp, input_comp = split_compression(args.input)
+        sub_input = input_no_comp.endswith('.sub')
     if not args.output and args.input:
-        args.output = splitext(args.input)[0] + '.cut' + splitext(args.input)[1]
+        args.output = [splitext(input_no_comp)[0] + 
+                       ('.uncut' if args.to_source else '.cut') + 
+                       splitext(input_no_comp)[1] + input_comp]
+    if args.input and sub_input:
+        for output in args.output:
+            if not split_compression(output)[0].endswith('.sub'):
+                exit('SUB (MicroDVD) input can only be saved as SUB')
     if not args.fps:
-        for tc_path in (avs_no_ext + suffix for suffix in _tc_suffix):
+        for tc_path in (avs_no_ext + suffix + comp for suffix in _tc_suffix 
+                        for comp in [''] + _compressed_ext):
             if isfile(tc_path):
                 args.fps = tc_path
                 vfr = True
@@ -146,8 +197,9 @@ def main():
             exit('Invalid FPS value or timecode file path')
     if not args.otc and not isinstance(args.otc, bool):
         if vfr:
-            args.otc = (splitext(splitext(args.fps)[0])[0] + '.otc' + 
-                        splitext(args.fps)[1])
+            tc_no_comp, tc_comp = split_compression(args.fps)
+            args.otc = (splitext(splitext(tc_no_comp)[0])[0] + '.otc' + 
+                        splitext(tc_no_comp)[1] + tc_comp)
         else:
             args.otc = avs_no_ext + '.otc.txt'
     if args.verbose:
@@ -158,7 +210,7 @@ def main():
             print('  Output timecodes: ' + args.otc)
         if args.input:
             print('  Input file:       ' + args.input + 
-              '\n  Output file:      ' + args.output)
+              '\n  Output file:      ' + ', '.join(args.output))
     if not args.input and not args.otc:
         print('\nPlease specify input subtitle or output timecode parameter\n')
         _parser.print_usage()
@@ -176,52 +228,64 @@ def main():
                       ", label '{}'".format(args.label) if args.label else '', 
                       trims_frames))
     
-    # Join contiguous Trims
-    trims_frames = join_trims(trims_frames)
+    # Sort and merge overlapping and contiguous Trims
+    trims_frames = normalize_trims(trims_frames)
 
     # Convert frames to timestamps.
     # Generate an offset value associated to every Trim.
     # Write a new timecode file if required
-    trims_time = frames2time(trims_frames, args.fps, vfr, args.otc)
+    trims_time, timecodes = frames2time(trims_frames, args.fps, vfr, args.otc,
+                                        args.to_source)
     if args.verbose and args.otc:
         print('\nNew timecode file written')
     
     if not args.input:
         return
     
+    # Map the trimmed video back to the source
+    if args.to_source:
+        trims_time = reverse_trims(trims_time, args.fps)
+    
     # Read subs from input file
-    if args.input.endswith('.sub'):
-        sub_subs(trims_frames, args.input, args.encoding, args.output)
+    if sub_input:
+        sub_subs(trims_frames, args.input, args.encoding, args.output, 
+                 args.to_source)
         if args.verbose:
             print('\nNew subtitle file written')
         return
     subs = pysubs.SSAFile()
-    try:
-        subs.from_file(file=args.input, encoding=args.encoding, fps=args.fps)
-    except pysubs.EncodingDetectionError:
+    with uncompressed(args.input) as input_path:
         try:
-            subs.from_file(file=args.input, encoding='utf8', fps=args.fps)
-        except UnicodeDecodeError:
-            print('\nCannot autodetect subtitle file encoding, '
-                  "assuming system's locale encoding")
+            subs.from_file(file=input_path, encoding=args.encoding, 
+                           fps=args.fps)
+        except pysubs.EncodingDetectionError:
             try:
-                subs.from_file(file=args.input, 
-                               encoding=getfilesystemencoding(), fps=args.fps)
-            except:
-                exit('\nCannot decode subtitle file, please specify '
-                     'the correct encoding')
-    except:
-        exit('\nCannot decode file with {}, please specify the correct encoding'
-             .format(args.encoding))
+                subs.from_file(file=input_path, encoding='utf8', fps=args.fps)
+            except UnicodeDecodeError:
+                print('\nCannot autodetect subtitle file encoding, '
+                      "assuming system's locale encoding")
+                try:
+                    subs.from_file(file=input_path, 
+                                   encoding=getfilesystemencoding(), 
+                                   fps=args.fps)
+                except:
+                    exit('\nCannot decode subtitle file, please specify '
+                         'the correct encoding')
+        except:
+            exit('\nCannot decode file with {}, please specify the correct '
+                 'encoding'.format(args.encoding))
 
     # Process subtitle lines
     subs = time_subs(trims_time, subs, vfr, args.fps)
 #    subs.iter_callback(resync, trims=trims_time, fps=args.fps, vfr=vfr)
+    if args.snap:
+        snap_subs(subs, args.fps, timecodes)
     
-    # Save file
-    subs.save(args.output)
+    # Save files
+    save_subs(subs, args.output, args.fps, timecodes)
     if args.verbose:
-        print('\nNew subtitle file written')
+        print('\nNew subtitle file{} written'.format(
+              's' if len(args.output) > 1 else ''))
 
 
 def prepare_parser():
@@ -288,8 +352,16 @@ def prepare_parser():
                           ' search for a valid input file')
     optional.add_argument('-c', '--encoding', 
                           help='Input subtitle file encoding')
-    optional.add_argument('-o', '--output', 
-                          help='Custom path for the output subtitle file')
+    optional.add_argument('-o', '--output', action='append', 
+                          help='Custom path for the output subtitle file. '
+                          'Repeat it to save several files, with the format '
+                          'taken from every extension')
+    optional.add_argument('-s', '--snap', action='store_true', 
+                          help='Snap the start and end of the output lines to '
+                          'frame boundaries')
+    optional.add_argument('--to-source', action='store_true', 
+                          help='The input subtitle file is timed against the '
+                          'trimmed video. Map it back to the source')
     return parser
 
 def read_trims(avs, reversed_=False, label=None, line_number=None):
@@ -306,7 +378,7 @@ def read_trims(avs, reversed_=False, label=None, line_number=None):
     """
     re_line = re.compile(r'^[^#]*\bTrim\s*\(\s*(\d+)\s*,\s*(-?\d+)\s*\).*{}'
                          .format('#\s*' + label if label else ''), re.IGNORECASE)
-    re_trim = re.compile(r'^[^#]*\bTrim\s*\(\s*(\d+)\s*,\s*(-?\d+)\s*\)', 
+    re_trim = re.compile(r'\bTrim\s*\(\s*(\d+)\s*,\s*(-?\d+)\s*\)', 
                          re.IGNORECASE)
     with open(avs) as file:
         lines = file.readlines()
@@ -314,15 +386,7 @@ def read_trims(avs, reversed_=False, label=None, line_number=None):
         lines = lines[line_number - 1:line_number]
     for line in reversed(lines) if reversed_ else lines:
         if re_line.search(line):
-            trims = []
-            end = len(line)
-            while(1):
-                res = re_trim.search(line[:end])
-                if res is None:
-                    break
-                else:
-                    trims.append(res.groups())
-                    end = res.start(1)
+            trims = re_trim.findall(line.split('#', 1)[0])
             break
     else:
         if label:
@@ -333,26 +397,42 @@ def read_trims(avs, reversed_=False, label=None, line_number=None):
         else:
            exit('\nNo Trims found in the specified Avisynth script')
     return [(int(trim[0]), int(trim[1]) if int(trim[1]) > 0 else int(trim[0]) - 
-            int(trim[1]) - 1) for trim in reversed(trims)]
+            int(trim[1]) - 1) for trim in trims]
 
-def join_trims(trims):
-    """Join contiguous Trims"""
-    new_trims = []
-    prev = -1
-    try:
-        for i, trim in enumerate(trims):
-            if prev == -1:
-                prev = trim[0]
-            if trims[i+1][0] - trim[1] != 1:
-                new_trims.append((prev, trim[1]))
-                prev = -1
-    except IndexError:
-        new_trims.append((prev, trims[-1][1]))
-    return new_trims
+def normalize_trims(trims):
+    """Sort and merge overlapping, duplicated and contiguous Trims
+    
+    Overlapping and duplicated Trims are always merged.  Contiguous Trims 
+    are merged only if they are also consecutive in the script, as they 
+    would be reordered otherwise.  The merged Trims keep the output order 
+    of their first member in the script, so segments reordered by the 
+    splicing stay in that order.  O(n log n).
+    
+    """
+    groups = []  # [start, end, first index, index of the member ending it]
+    for i in sorted(range(len(trims)), key=lambda i: trims[i]):
+        start, end = trims[i]
+        if groups and (start <= groups[-1][1] or 
+                       start == groups[-1][1] + 1 and i == groups[-1][3] + 1):
+            group = groups[-1]
+            if end >= group[1]:
+                group[1] = end
+                group[3] = i
+            group[2] = min(group[2], i)
+        else:
+            groups.append([start, end, i, i])
+    groups.sort(key=lambda group: group[2])
+    return [(group[0], group[1]) for group in groups]
 
-def sub_subs(trims, input, encoding, output):
-    """Read, cut and save SUB (MicroDVD) subtitle files"""
-    with open(input, mode='rb') as b_input:
+def sub_subs(trims, input, encoding, outputs, to_source=False):
+    """Read, cut and save SUB (MicroDVD) subtitle files
+    
+    The result is saved to every path in 'outputs'.  If 'to_source', the 
+    input is timed against the trimmed video and is mapped back to the 
+    source instead.
+    
+    """
+    with open_file(input, mode='rb') as b_input:
         bom = b_input.read(3)
     if bom.startswith(b'\xef\xbb\xbf'):
         encoding = 'utf-8-sig'
@@ -362,20 +442,21 @@ def sub_subs(trims, input, encoding, output):
         encoding = 'utf-16-be'
     if encoding:
         try:
-            with open(input, encoding=encoding) as file:
+            with open_file(input, encoding=encoding) as file:
                 lines = file.readlines()
         except:
             exit('Cannot decode file with {}, please specify the correct '
                  'encoding'.format(encoding))
     else:
         try:
-            with open(input, encoding='utf8') as file:
+            with open_file(input, encoding='utf8') as file:
                 lines = file.readlines()
         except:
             print('\nCannot autodetect subtitle file encoding, '
                   "assuming system's locale encoding")
             try:
-                with open(input, encoding=getfilesystemencoding()) as file:
+                with open_file(input, 
+                               encoding=getfilesystemencoding()) as file:
                     lines = file.readlines()
             except:
                 exit('\nCannot decode subtitle file, please specify '
@@ -386,28 +467,144 @@ def sub_subs(trims, input, encoding, output):
     if re_sub.findall(lines[0])[0] == ('1', '1'):
         new_lines.append(lines[0])
         lines[:1] = []
+    lines = [(line, [int(i) for i in re_sub.findall(line)[0]]) 
+             for line in lines]
+    offsets = []
     prev_end = -1
     for trim in trims:
-        offset = trim[0] - prev_end - 1
-        prev_end = trim[1] - offset
-        for line in lines:
-            start, end = re_sub.findall(line)[0]
-            start = int(start)
-            end = int(end)
-            if start < trim[1] and end > trim[0]:
-                if start < trim[0]:
-                    start = trim[0]
-                if end > trim[1]:
-                    end = trim[1]
-                start -= offset
-                end -= offset
-                new_lines.append(re_sub.sub('{{{}}}{{{}}}'.format(start, end), 
-                                            line))
+        offsets.append(trim[0] - prev_end - 1)
+        prev_end = trim[1] - offsets[-1]
+    if to_source:
+        trims = [(trim[0] - offset, trim[1] - offset) 
+                 for trim, offset in zip(trims, offsets)]
+        offsets = [-offset for offset in offsets]
+    ranges = cut_ranges(trims, [bounds for line, bounds in lines])
+    for i, (trim, offset) in enumerate(zip(trims, offsets)):
+        for line, (start, end) in (lines[j] for j in ranges[i]):
+            if start < trim[0]:
+                start = trim[0]
+            if end > trim[1]:
+                end = trim[1]
+            start -= offset
+            end -= offset
+            new_lines.append(re_sub.sub('{{{}}}{{{}}}'.format(start, end), 
+                                        line))
         if not new_lines[-1].endswith('\n'):
             new_lines[-1] += '\n'
     
-    with open(output, mode='w', encoding='utf_8_sig') as file:
-        file.writelines(new_lines)
+    for output in outputs:
+        with open_file(output, mode='w', encoding='utf_8_sig') as file:
+            file.writelines(new_lines)
+
+
+def split_compression(path):
+    """Split a path in (path without compression extension, extension)"""
+    name, ext = splitext(path)
+    if ext.lower() in _compressed_ext:
+        return name, ext
+    return path, ''
+
+def compression(path, mode='r'):
+    """Return the compression extension of a file, or '' if not compressed
+    
+    When reading, the compression is detected from the magic bytes at 
+    the start of the file.  When writing, from the extension of the path.
+    
+    """
+    if 'r' in mode:
+        with open(path, mode='rb') as file:
+            magic = file.read(6)
+        if magic.startswith(b'\x1f\x8b'):
+            ext = '.gz'
+        elif magic.startswith(b'BZh'):
+            ext = '.bz2'
+        elif magic.startswith(b'\xfd7zXZ\x00'):
+            ext = '.xz'
+        else:
+            ext = ''
+    else:
+        ext = split_compression(path)[1].lower()
+    if ext == '.xz' and lzma is None:
+        exit('\nPython 3.3 is required for xz compressed files')
+    if ext == '.bz2' and version_info < (3,3):
+        exit('\nPython 3.3 is required for bzip2 compressed files')
+    return ext
+
+def open_file(path, mode='r', encoding=None):
+    """Open a file for reading or writing, compressed or not
+    
+    Same as the built-in open(), but the data is decompressed/compressed 
+    on the fly if required.
+    
+    """
+    ext = compression(path, mode)
+    if not ext:
+        return open(path, mode=mode, encoding=encoding)
+    binary_mode = mode.replace('b', '')
+    if ext == '.gz':
+        file = gzip.GzipFile(path, mode=binary_mode)
+    elif ext == '.bz2':
+        file = bz2.BZ2File(path, mode=binary_mode)
+    else:
+        file = lzma.LZMAFile(path, mode=binary_mode)
+    if 'b' in mode:
+        return file
+    return TextIOWrapper(file, encoding=encoding)
+
+@contextmanager
+def uncompressed(path, mode='r'):
+    """Provide a path to an uncompressed version of a file
+    
+    Used for PySubs, that only works with paths.  When reading, a 
+    compressed file is decompressed to a temporary file.  When writing, 
+    the temporary file is compressed to 'path' when closing.  If the file 
+    is not compressed then 'path' is used directly.
+    
+    """
+    if not compression(path, mode):
+        yield path
+        return
+    fd, tmp_path = mkstemp(suffix=splitext(split_compression(path)[0])[1])
+    close(fd)
+    try:
+        if 'r' in mode:
+            with open_file(path, mode='rb') as src:
+                with open(tmp_path, mode='wb') as dst:
+                    copyfileobj(src, dst)
+        yield tmp_path
+        if 'w' in mode:
+            with open(tmp_path, mode='rb') as src:
+                with open_file(path, mode='wb') as dst:
+                    copyfileobj(src, dst)
+    finally:
+        remove(tmp_path)
+
+
+class TrimTable():
+
+    def __init__(self, trims):
+        """Initialize TrimTable class
+        
+        Sorted table of non-overlapping Trims, searchable by binary search.
+        
+        trims: list of (start, end) pairs in output order, as frames or 
+            times (class Time)
+        
+        Attributes:
+            starts: sorted start values
+            ends: end values, in the same order
+            index: position in 'trims' of every entry
+        
+        """
+        self.index = sorted(range(len(trims)), key=lambda i: trims[i][0])
+        self.starts = [trims[i][0] for i in self.index]
+        self.ends = [trims[i][1] for i in self.index]
+
+    def overlapping(self, start, end):
+        """Return the positions in 'trims' of the Trims overlapping the 
+        range (start, end), sorted by start"""
+        return self.index[bisect_right(self.ends, start):
+                          bisect_left(self.starts, end)]
 
 
 class Trim():
@@ -503,7 +700,26 @@ def timecode_v1_to_v2(lines, offset=0, start=0, end=None, default=24/1.001):
         offset = float(v2[-1])
     return v2
 
-def frames2time(trims_frames, fps, vfr=None, otc=None):
+def read_timecodes(path, end):
+    """Read a timecode file (v1 or v2)
+    
+    Return the list of timecode v2 lines (str, excluding header), up to 
+    the end of frame 'end'.
+    
+    """
+    with open_file(path) as itc:
+        header = itc.readline().strip()
+        if header == '# timecode format v2':
+            lines = itc.readlines()
+        elif header == '# timecode format v1':
+            lines = timecode_v1_to_v2(itc.readlines(), end=end)
+        else:
+            exit('Invalid timecode file')
+    if len(lines) == end + 1:  # tc_v2 didn´t include the last frame duration
+        lines.append(str(2 * float(lines[-1]) - float(lines[-2])) + '\n')
+    return lines
+
+def frames2time(trims_frames, fps, vfr=None, otc=None, source=False):
 
     """Convert frame-based Trims to timestamps. Write a new timecode.
     
@@ -514,6 +730,11 @@ def frames2time(trims_frames, fps, vfr=None, otc=None):
       Using constant fps: frames offset
       Using timecodes: time offset
     
+    Return the list of Trims and, using timecodes, the timestamps (ms) 
+    of every frame of the trimmed video plus the end of the last one, as 
+    an array, or of the source video if 'source'.  None using constant 
+    fps.
+    
     """
     
     trims_time = []
@@ -524,23 +745,15 @@ def frames2time(trims_frames, fps, vfr=None, otc=None):
     if vfr:
         
         # Read timecode file
-        with open(fps) as itc:
-            header = itc.readline().strip()
-            if header == '# timecode format v2':
-                lines = itc.readlines()
-            elif header == '# timecode format v1':
-                lines = timecode_v1_to_v2(itc.readlines(), 
-                                          end=trims_frames[-1][1])
-            else:
-                exit('Invalid timecode file')
+        lines = read_timecodes(fps, max(trim[1] for trim in trims_frames))
             
         # Convert frames to timestamps
-        new_lines = ['# timecode format v2\n', '0.000\n']
+        timecodes = array('d', [0])
         for trim in trims_frames:
             trim_start_time = float(lines[trim[0]])
             try:
                 trim_end_time = float(lines[trim[1] + 1])
-            except IndexError:  # tc_v2 didn´t include the last frame duration
+            except IndexError:  # Trim past the end of the timecode file
                 trim_end_time = 2 * float(lines[-1]) - float(lines[-2])
                 lines.append(trim_end_time)
             gap = trim_start_time - prev_end
@@ -549,15 +762,19 @@ def frames2time(trims_frames, fps, vfr=None, otc=None):
                     end=pysubs.Time(**time_format(trim_end_time, dic=True)),
                     time_shift=time_format(-gap, dic=True)))
             prev_end = trim_end_time - gap
-            if otc:
-                new_lines.extend('{:.3f}\n'.format(float(line) - gap) 
-                                 for line in lines[trim[0] + 1:trim[1] + 2])
+            timecodes.extend(float(line) - gap 
+                             for line in lines[trim[0] + 1:trim[1] + 2])
         if otc:
-            with open(otc, mode='w') as otc_file:
-                otc_file.writelines(new_lines)
+            with open_file(otc, mode='w') as otc_file:
+                otc_file.write('# timecode format v2\n')
+                otc_file.writelines('{:.3f}\n'.format(time) 
+                                    for time in timecodes)
+        if source:
+            timecodes = array('d', (float(line) for line in lines))
 
     # Use constant fps
     else:
+        timecodes = None
         for trim in trims_frames:
             gap = trim[0] - prev_end
             trims_time.append(Trim( 
@@ -567,11 +784,48 @@ def frames2time(trims_frames, fps, vfr=None, otc=None):
             prev_end = trim[1] + 1 - gap
         if otc:
             ms = 1000 / float(fps)
-            with open(otc, mode='w') as otc_file:
+            with open_file(otc, mode='w') as otc_file:
                 otc_file.write('# timecode format v2\n')
                 otc_file.writelines(('{:.3f}\n'.format(ms * i) 
                                      for i in range(prev_end + 1)))
-    return trims_time
+    return trims_time, timecodes
+
+def reverse_trims(trims, fps):
+    """Invert the Trims returned by frames2time
+    
+    Return a list of Trims, one for every segment of the trimmed video, 
+    covering the range of the segment in the trimmed video and with the 
+    shift that moves it back to its position in the source.  They are 
+    sorted by their cumulative offset in the trimmed video, so time_subs 
+    can map subtitles timed against the trimmed video back to the source.
+    
+    The ranges are the source ones shifted like the subtitle lines are 
+    when cutting, so both directions round the times the same way.  
+    Every range starts at the end of the previous one, as rounding can 
+    make them overlap by a ms.
+    
+    """
+    new_trims = []
+    for trim in trims:
+        if trim.time_shift:
+            t = trim.time_shift
+            shift = ((t['h'] * 60 + t['m']) * 60 + t['s']) * 1000 + t['ms']
+            new_trim = Trim(time_shift=dict((unit, -value) for unit, value 
+                                            in t.items()))
+        else:
+            shift = time_ms(pysubs.Time(frame=abs(trim.frame_shift), fps=fps))
+            if trim.frame_shift < 0:
+                shift = -shift
+            new_trim = Trim(frame_shift=-trim.frame_shift)
+        new_trim.start = pysubs.Time(**time_format(time_ms(trim.start) + shift, 
+                                                   dic=True))
+        new_trim.end = pysubs.Time(**time_format(time_ms(trim.end) + shift, 
+                                                 dic=True))
+        new_trims.append(new_trim)
+    for prev_trim, new_trim in zip(new_trims, new_trims[1:]):
+        if new_trim.start < prev_trim.end:
+            new_trim.start = prev_trim.end
+    return new_trims
 
 def time_subs(trims, subs, vfr, fps):
     """Cut and offset time-based text subtitle files"""
@@ -580,21 +834,146 @@ def time_subs(trims, subs, vfr, fps):
     new_subs.styles = subs.styles.copy()
     new_subs.fonts = subs.fonts.copy()
     new_subs.events = []
-    for trim in trims:
-        for line in subs:
-            if line.end > trim.start and line.start < trim.end:
-                new_line = line.copy()
-                if new_line.start < trim.start:
-                    new_line.start = trim.start
-                if new_line.end > trim.end:
-                    new_line.end = trim.end
-                if vfr:
-                    new_line.shift(**trim.time_shift)
-                else:
-                    new_line.shift(frame=trim.frame_shift, fps=fps)
-                new_subs.events.append(new_line)
+    ranges = cut_ranges([(trim.start, trim.end) for trim in trims], 
+                        [(line.start, line.end) for line in subs.events])
+    for i, trim in enumerate(trims):
+        for line in (subs.events[j] for j in ranges[i]):
+            new_line = line.copy()
+            if new_line.start < trim.start:
+                new_line.start = trim.start
+            if new_line.end > trim.end:
+                new_line.end = trim.end
+            if vfr:
+                new_line.shift(**trim.time_shift)
+            else:
+                new_line.shift(frame=trim.frame_shift, fps=fps)
+            new_subs.events.append(new_line)
     return new_subs
 
+def cut_ranges(trims, lines):
+    """Find the subtitle lines cut by every Trim
+    
+    'trims' and 'lines' are lists of (start, end) pairs, both as frames 
+    or as times.  Return a list with the indexes of the lines overlapping 
+    every Trim.
+    
+    O(lines * log(trims)), using a TrimTable.
+    
+    """
+    table = TrimTable(trims)
+    ranges = [[] for trim in trims]
+    for j, (start, end) in enumerate(lines):
+        for k in table.overlapping(start, end):
+            ranges[k].append(j)
+    return ranges
+
+def time_ms(time):
+    """Convert a time (class Time) to ms"""
+    return ((time.h * 60 + time.m) * 60 + time.s) * 1000 + time.ms
+
+def time2frame(time, fps, timecodes=None):
+    """Return the frame whose start is the nearest to a time (ms)
+    
+    Use the timecodes array returned by frames2time if given (binary 
+    search), or else the constant 'fps'.
+    
+    """
+    if timecodes is None:
+        return round(time * fps / 1000)
+    i = bisect_left(timecodes, time)
+    if i == len(timecodes) or i and time - timecodes[i-1] < timecodes[i] - time:
+        i -= 1
+    return i
+
+def time2frames(times, fps, timecodes=None):
+    """Return the list of frames whose start is the nearest to every time
+    
+    As time2frame, for a list of times (ms) in a single pass. 
+    
+    """
+    if timecodes is None:
+        return [round(time * fps / 1000) for time in times]
+    frames = []
+    end = len(timecodes)
+    for time in times:
+        time = float(time)  # faster comparisons with the array items
+        i = bisect_left(timecodes, time)
+        if i == end or i and time - timecodes[i-1] < timecodes[i] - time:
+            i -= 1
+        frames.append(i)
+    return frames
+
+def frame2time(frame, fps, timecodes=None):
+    """Return the start time (ms) of a frame, the inverse of time2frame"""
+    if timecodes is None:
+        return frame * 1000 / fps
+    return timecodes[frame]
+
+def snap_subs(subs, fps, timecodes=None):
+    """Snap the start and end of every line to the nearest frame boundary
+    
+    Use the timecodes array returned by frames2time if given, or else 
+    the constant 'fps'.  Lines shorter than a frame are kept on screen 
+    for one frame.  The times are converted to ms and looked up once, 
+    and a new Time is only built if the snapped time differs. 
+    O(lines * log(frames)).
+    
+    """
+    events = subs.events
+    times = ([time_ms(line.start) for line in events] + 
+             [time_ms(line.end) for line in events])
+    frames = time2frames(times, fps, timecodes)
+    count = len(events)
+    last_frame = len(timecodes) - 1 if timecodes is not None else None
+    for line, start, end, start_frame, end_frame in zip(
+            events, times, times[count:], frames, frames[count:]):
+        if end > start and end_frame <= start_frame:
+            end_frame = start_frame + 1
+            if last_frame is not None and end_frame > last_frame:
+                start_frame, end_frame = last_frame - 1, last_frame
+        snapped = round(frame2time(start_frame, fps, timecodes))
+        if snapped != start:
+            line.start = pysubs.Time(ms=snapped)
+        snapped = round(frame2time(end_frame, fps, timecodes))
+        if snapped != end:
+            line.end = pysubs.Time(ms=snapped)
+
+def save_sub(subs, output, fps, timecodes=None):
+    """Save time-based subtitles as SUB (MicroDVD)
+    
+    The frames are taken from the timecodes array returned by frames2time 
+    if given, or else calculated with the constant 'fps'.  Override tags 
+    are removed and line breaks converted.
+    
+    """
+    re_tags = re.compile(r'{[^}]*}')
+    lines = ['{{1}}{{1}}{:.3f}\n'.format(fps)] if timecodes is None else []
+    for line in subs.events:
+        lines.append('{{{}}}{{{}}}{}\n'.format(
+                     time2frame(time_ms(line.start), fps, timecodes), 
+                     time2frame(time_ms(line.end), fps, timecodes), 
+                     re_tags.sub('', line.text).replace('\\N', '|')
+                                                .replace('\\n', '|')))
+    with open_file(output, mode='w', encoding='utf_8_sig') as file:
+        file.writelines(lines)
+
+def save_subs(subs, outputs, fps, timecodes=None):
+    """Save time-based subtitles to several files
+    
+    The format of every file is given by its extension.  The files are 
+    serialized concurrently.
+    
+    """
+    def save(output):
+        if split_compression(output)[0].endswith('.sub'):
+            save_sub(subs, output, fps, timecodes)
+        else:
+            with uncompressed(output, mode='w') as output_path:
+                subs.save(output_path)
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        for future in [executor.submit(save, output) for output in outputs]:
+            future.result()
+
 def resync(subs, line, **vars):
     """Resync subtitles lines according to Trims
     